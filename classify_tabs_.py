@@ -1,42 +1,82 @@
+import typing
 from pathlib import Path
 
 import yaml
 
 from generate_continuation import generate_continuation
+from instrumentation import NULL_INSTRUMENTATION, Instrumentation, instrumented_run
+from metadata_store import MetadataStore
 from preprocess_urls import get_url_meta
 
 
-def main():
-    base_prompt_file = Path("data/prompt.yaml")
-    url = "https://arxiv.org/pdf/2212.07677.pdf"
+def main(
+    instrument: str | None = None,
+    instrument_format: typing.Literal["json", "chrome"] = "json",
+    profile: bool = False,
+    trace_memory: bool = False,
+    store: str | None = None,
+):
+    with instrumented_run(
+        instrument, fmt=instrument_format, profile=profile, trace_memory=trace_memory
+    ) as instr:
+        base_prompt_file = Path("data/prompt.yaml")
+        url = "https://arxiv.org/pdf/2212.07677.pdf"
 
-    if not base_prompt_file.exists:
-        raise ValueError(
-            f"Base prompt file {base_prompt_file.absolute} does not exist."
+        if not base_prompt_file.exists:
+            raise ValueError(
+                f"Base prompt file {base_prompt_file.absolute} does not exist."
+            )
+
+        url_meta: dict = get_url_meta(url, instr=instr)
+        prompt = generate_prompt(url, base_prompt_file, instr=instr, url_meta=url_meta)
+        print(prompt)
+        continuation = generate_continuation(
+            prompt, max_length=30, stop_token="]", instr=instr
         )
 
-    prompt = generate_prompt(url, base_prompt_file)
-    print(prompt)
-    continuation = generate_continuation(prompt, max_length=30, stop_token="]")
+        tags = extract_tags(continuation)
+        print(f"Tags for {url}: {tags}")
+
+        if store is not None:
+            with MetadataStore(store) as db:
+                db.append(url_meta)
+                db.add_tags(url_meta["url"], tags)
 
-    tags = extract_tags(continuation)
-    print(f"Tags for {url}: {tags}")
 
+def generate_prompt(
+    url: str,
+    base_prompt_file: Path,
+    instr: Instrumentation = NULL_INSTRUMENTATION,
+    url_meta: dict | None = None,
+):
+    if url_meta is None:
+        url_meta = get_url_meta(url, instr=instr)
 
-def generate_prompt(url: str, base_prompt_file: Path):
     # have to wrap in a list to make sure it's the same format as the base_prompt
     # TODO tidy this up
-    metadata = [get_url_meta(url)]
+    metadata = [url_meta]
 
-    base_prompt = base_prompt_file.read_text()
-    url_prompt = yaml.dump(metadata, sort_keys=False)
+    with instr.stage("prompt", url=url):
+        base_prompt = base_prompt_file.read_text()
+        url_prompt = yaml.dump(metadata, sort_keys=False)
 
     return base_prompt.strip() + "\n" + url_prompt + "  tags: ["
 
 
-def extract_tags(continuation: str):
-    return continuation.split(", ")
+def extract_tags(continuation: str) -> list[str]:
+    """split a generated `tag, tag, ...]` continuation into clean tags
+
+    if generation stopped before the closing `]`, the last tag may be cut off,
+    so it is dropped
+    """
+    continuation = continuation.strip()
+    tags: list[str] = continuation.removesuffix("]").split(",")
+    if not continuation.endswith("]"):
+        tags = tags[:-1]
+    return [t.strip() for t in tags if t.strip()]
 
 
 if __name__ == "__main__":
-    main()
+    import fire  # type: ignore[import]
+
+    fire.Fire(main)
@@ -7,6 +7,8 @@ import torch
 from transformers import (AutoModelForCausalLM,  # type: ignore[import]
                           AutoTokenizer)
 
+from instrumentation import NULL_INSTRUMENTATION, Instrumentation
+
 # pylint: disable=missing-class-docstring,missing-function-docstring,dangerous-default-value
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
@@ -31,7 +33,10 @@ if not typing.TYPE_CHECKING:
 # helper functions
 # ==============================
 def generate_continuation(
-    prompt: str, max_length: int = 5, stop_token: str | None = None
+    prompt: str,
+    max_length: int = 5,
+    stop_token: str | None = None,
+    instr: Instrumentation = NULL_INSTRUMENTATION,
 ) -> str:
     """Generate continuation text for a given prompt using a pre-trained LLM.
 
@@ -41,6 +46,8 @@ def generate_continuation(
           Defaults to 5.
         stop_token (str, optional): The token to stop generating text at.
           Defaults to None.
+        instr (Instrumentation, optional): Records tokenization and generation
+          latency and token counts. Defaults to a disabled instance.
 
     Returns:
         str: The generated text continuation for the prompt.
@@ -49,16 +56,23 @@ def generate_continuation(
         >>> generate_continuation("The sky is", max_length=10, stop_token=".")
         'The sky is blue.'
     """
-    input_ids: torch.Tensor = TOKENIZER.encode(prompt, return_tensors="pt")
-    generated_text_ids = MODEL.generate(
-        input_ids=input_ids.to(device),
-        max_length=max_length + len(input_ids[0]),
-        do_sample=False,
-    )
-    generated_text: str = TOKENIZER.decode(
-        generated_text_ids[0], clean_up_tokenization_spaces=True
-    )
-    prompt_stripped = TOKENIZER.decode(input_ids[0], clean_up_tokenization_spaces=True)
+    with instr.stage("tokenize") as info:
+        input_ids: torch.Tensor = TOKENIZER.encode(prompt, return_tensors="pt")
+        info["prompt_tokens"] = len(input_ids[0])
+    with instr.stage("generate") as info:
+        generated_text_ids = MODEL.generate(
+            input_ids=input_ids.to(device),
+            max_length=max_length + len(input_ids[0]),
+            do_sample=False,
+        )
+        info["generated_tokens"] = len(generated_text_ids[0]) - len(input_ids[0])
+    with instr.stage("decode"):
+        generated_text: str = TOKENIZER.decode(
+            generated_text_ids[0], clean_up_tokenization_spaces=True
+        )
+        prompt_stripped = TOKENIZER.decode(
+            input_ids[0], clean_up_tokenization_spaces=True
+        )
     post_prompt_text: str = generated_text[len(prompt_stripped) :]
 
     stop_index = post_prompt_text.find(stop_token) + 1 if stop_token else None
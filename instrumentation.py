@@ -0,0 +1,282 @@
+"""opt-in timing and profiling for the tab pipeline
+
+records per-stage (and per-URL) wall time plus arbitrary counters such as bytes
+downloaded or token counts, optionally wrapping the run in `cProfile` and/or
+`tracemalloc`. at the end of a run the results are written either as a JSON
+summary or as a Chrome trace file (open in `chrome://tracing` or Perfetto)
+
+functions in the pipeline take an `instr: Instrumentation` argument defaulting to
+`NULL_INSTRUMENTATION`, which is disabled and records nothing. entry points wrap
+their body in `instrumented_run`, which writes the results even if the run fails
+"""
+
+import cProfile
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+import typing
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterator
+
+# pylint: disable=missing-class-docstring
+
+
+@dataclass(kw_only=True)
+class StageRecord:
+    stage: str
+    start: float  # seconds since the instrumentation was started
+    duration: float
+    url: str | None = None
+    thread_id: int = 0
+    extra: dict = field(default_factory=dict)
+
+    def serialize(self) -> dict:
+        return dict(
+            stage=self.stage,
+            start=self.start,
+            duration=self.duration,
+            url=self.url,
+            extra=self.extra,
+        )
+
+
+@dataclass(kw_only=True)
+class Instrumentation:
+    enabled: bool = True
+    profile: bool = False
+    trace_memory: bool = False
+    profile_top_n: int = 30
+    records: list[StageRecord] = field(default_factory=list)
+    counters: dict[str, float] = field(default_factory=dict)
+    _t0: float = field(default_factory=time.perf_counter, repr=False)
+    _profiler: cProfile.Profile | None = field(default=None, repr=False)
+    _memory: dict | None = field(default=None, repr=False)
+    _started_tracemalloc: bool = field(default=False, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def start(self) -> "Instrumentation":
+        """reset the clock and start the profiler and memory tracer, if requested"""
+        if not self.enabled:
+            return self
+        self._t0 = time.perf_counter()
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        if self.profile:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        return self
+
+    def stop(self) -> None:
+        """stop the profiler and memory tracer, keeping their results
+
+        tracemalloc is only stopped if it was started by this instance
+        """
+        if self._profiler is not None:
+            self._profiler.disable()
+        if self.trace_memory and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+                self._started_tracemalloc = False
+            self._memory = dict(
+                current_bytes=current,
+                peak_bytes=peak,
+                top_allocations=[
+                    dict(location=str(stat.traceback), size=stat.size, count=stat.count)
+                    for stat in snapshot.statistics("lineno")[: self.profile_top_n]
+                ],
+            )
+
+    @contextmanager
+    def stage(self, name: str, url: str | None = None, **extra) -> Iterator[dict]:
+        """time the body of a `with` block as stage `name`
+
+        yields a dict which the caller can fill with extra info about the stage
+        (e.g. `bytes` or `tokens`). numeric values are also summed into `counters`
+        """
+        info: dict = dict(extra)
+        if not self.enabled:
+            yield info
+            return
+
+        t_start: float = time.perf_counter()
+        try:
+            yield info
+        finally:
+            t_end: float = time.perf_counter()
+            record = StageRecord(
+                stage=name,
+                start=t_start - self._t0,
+                duration=t_end - t_start,
+                url=url,
+                thread_id=threading.get_ident(),
+                extra=info,
+            )
+            with self._lock:
+                self.records.append(record)
+                for k, v in info.items():
+                    if isinstance(v, (int, float)) and not isinstance(v, bool):
+                        self.counters[k] = self.counters.get(k, 0) + v
+
+    def count(self, key: str, value: float = 1) -> None:
+        """add `value` to the counter `key`"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def stage_summary(self) -> dict[str, dict]:
+        """aggregate timings by stage name"""
+        output: dict[str, dict] = dict()
+        for r in self.records:
+            s = output.setdefault(r.stage, dict(calls=0, total=0.0, max=0.0))
+            s["calls"] += 1
+            s["total"] += r.duration
+            s["max"] = max(s["max"], r.duration)
+        for s in output.values():
+            s["mean"] = s["total"] / s["calls"]
+        return output
+
+    def url_summary(self) -> dict[str, dict]:
+        """aggregate timings and extra info by URL"""
+        output: dict[str, dict] = dict()
+        for r in self.records:
+            if r.url is None:
+                continue
+            u = output.setdefault(r.url, dict(total=0.0, stages=dict()))
+            u["total"] += r.duration
+            u["stages"][r.stage] = u["stages"].get(r.stage, 0.0) + r.duration
+            for k, v in r.extra.items():
+                if isinstance(v, (int, float)) and not isinstance(v, bool):
+                    u[k] = u.get(k, 0) + v
+                else:
+                    u[k] = v
+        return output
+
+    def profile_summary(self) -> list[dict]:
+        """top functions by cumulative time, if profiling was enabled"""
+        if self._profiler is None:
+            return list()
+        stats = pstats.Stats(self._profiler)
+        output: list[dict] = list()
+        # maps (file, line, func) -> (cc, ncalls, tottime, cumtime, callers)
+        items = sorted(
+            stats.stats.items(),  # type: ignore[attr-defined]
+            key=lambda kv: kv[1][3],
+            reverse=True,
+        )
+        for (fname, lineno, func), (_, ncalls, tottime, cumtime, _) in items[
+            : self.profile_top_n
+        ]:
+            output.append(
+                dict(
+                    function=f"{fname}:{lineno}({func})",
+                    ncalls=ncalls,
+                    tottime=tottime,
+                    cumtime=cumtime,
+                )
+            )
+        return output
+
+    def summary(self) -> dict:
+        output: dict = dict(
+            wall_time=time.perf_counter() - self._t0,
+            stages=self.stage_summary(),
+            counters=self.counters,
+            urls=self.url_summary(),
+        )
+        if self._profiler is not None:
+            output["profile"] = self.profile_summary()
+        if self._memory is not None:
+            output["memory"] = self._memory
+        return output
+
+    def chrome_trace(self) -> dict:
+        """records in the Chrome trace event format, timestamps in microseconds"""
+        pid: int = os.getpid()
+        events: list[dict] = list()
+        for r in self.records:
+            args: dict = dict(r.extra)
+            if r.url is not None:
+                args["url"] = r.url
+            events.append(
+                dict(
+                    name=r.stage,
+                    cat="tabgpt",
+                    ph="X",
+                    ts=r.start * 1e6,
+                    dur=r.duration * 1e6,
+                    pid=pid,
+                    tid=r.thread_id,
+                    args=args,
+                )
+            )
+        return dict(traceEvents=events, otherData=self.summary())
+
+    def dump(
+        self,
+        fname: str,
+        fmt: typing.Literal["json", "chrome"] = "json",
+    ) -> None:
+        """stop and write the results to `fname`
+
+        if profiling was enabled, the raw profile is also written to `{fname}.prof`
+        """
+        if not self.enabled:
+            return
+        self.stop()
+
+        data: dict
+        if fmt == "json":
+            data = dict(
+                summary=self.summary(),
+                records=[r.serialize() for r in self.records],
+            )
+        else:
+            # validated up front by `instrumented_run`
+            assert fmt == "chrome", f"Unknown instrumentation format: {fmt}"
+            data = self.chrome_trace()
+
+        with open(fname, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent="  ", default=str)
+
+        if self._profiler is not None:
+            self._profiler.dump_stats(f"{fname}.prof")
+
+
+NULL_INSTRUMENTATION: Instrumentation = Instrumentation(enabled=False)
+
+
+@contextmanager
+def instrumented_run(
+    fname: str | None,
+    fmt: typing.Literal["json", "chrome"] = "json",
+    profile: bool = False,
+    trace_memory: bool = False,
+) -> Iterator[Instrumentation]:
+    """yield an `Instrumentation` for a run, always dumping it to `fname` at the end
+
+    results are written even if the run raises or is interrupted. if `fname` is
+    `None`, yields `NULL_INSTRUMENTATION` instead
+    """
+    if fmt not in ["json", "chrome"]:
+        raise ValueError(f"Unknown instrumentation format: {fmt}")
+    if fname is None:
+        if profile or trace_memory:
+            raise ValueError(
+                "`profile` and `trace_memory` require an `instrument` output file"
+            )
+        yield NULL_INSTRUMENTATION
+        return
+
+    instr = Instrumentation(profile=profile, trace_memory=trace_memory).start()
+    try:
+        yield instr
+    finally:
+        instr.dump(fname, fmt=fmt)
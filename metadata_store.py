@@ -0,0 +1,183 @@
+"""SQLite storage for extracted URL metadata and classification tags
+
+each record is the dict returned by `preprocess_urls.get_url_meta`, stored as JSON
+alongside indexed `url`, `host` and `error` columns. tags (e.g. from classification)
+live in a separate indexed table, so downstream steps can look up a URL or scan by
+host/tag without loading the whole corpus into memory
+
+records are keyed by the output of `url_utils.preprocess_url`. URLs passed to the
+store are normalised the same way, so the original tab URL can be used for lookups
+
+```python
+url = "https://arxiv.org/pdf/2212.07677.pdf"
+with MetadataStore("tabs.db") as store:
+    store.append(get_url_meta(url))
+    store.add_tags(url, ["research/interpretability"])
+    for meta in store.scan(tag="research/interpretability"):
+        ...
+```
+"""
+
+import json
+import sqlite3
+import typing
+from typing import Iterable, Iterator
+from urllib.parse import urlsplit
+
+from url_utils import preprocess_url
+
+_SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS meta (
+    url TEXT PRIMARY KEY,
+    host TEXT,
+    error INTEGER NOT NULL DEFAULT 0,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_meta_host ON meta (host);
+CREATE INDEX IF NOT EXISTS idx_meta_error ON meta (error);
+CREATE TABLE IF NOT EXISTS tags (
+    url TEXT NOT NULL,
+    tag TEXT NOT NULL,
+    PRIMARY KEY (url, tag)
+);
+CREATE INDEX IF NOT EXISTS idx_tags_tag ON tags (tag);
+"""
+
+
+def get_host(url: str) -> str:
+    """lowercased hostname of a URL, which may or may not have had its scheme stripped
+
+    credentials and port are dropped
+    """
+    if "://" not in url:
+        url = f"http://{url}"
+    return urlsplit(url).hostname or ""
+
+
+class MetadataStore:
+    """append-only (upserting) store of URL metadata, backed by a SQLite file
+
+    all methods taking a url normalise it with `preprocess_url` first
+    """
+
+    def __init__(self, fname: str, batch_size: int = 100) -> None:
+        self.fname: str = fname
+        self.batch_size: int = batch_size
+        self.conn: sqlite3.Connection = sqlite3.connect(fname)
+        self.conn.executescript(_SCHEMA)
+        self._pending: int = 0
+
+    def __enter__(self) -> "MetadataStore":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.conn.commit()
+        self.conn.close()
+
+    def commit(self) -> None:
+        self.conn.commit()
+        self._pending = 0
+
+    def _maybe_commit(self, n: int) -> None:
+        self._pending += n
+        if self._pending >= self.batch_size:
+            self.commit()
+
+    def append(self, meta: dict | Iterable[dict]) -> None:
+        """add one or more metadata dicts, replacing any record with the same url"""
+        records: list[dict] = [meta] if isinstance(meta, dict) else list(meta)
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO meta (url, host, error, data) VALUES (?, ?, ?, ?)",
+            [
+                (
+                    preprocess_url(m["url"]),
+                    get_host(m["url"]),
+                    int(bool(m.get("error", False))),
+                    json.dumps(m),
+                )
+                for m in records
+            ],
+        )
+        self._maybe_commit(len(records))
+
+    def add_tags(self, url: str, tags: Iterable[str]) -> None:
+        """attach tags to a url. the url need not have metadata stored yet"""
+        url = preprocess_url(url)
+        tags_list: list[str] = [t for t in tags if t]
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO tags (url, tag) VALUES (?, ?)",
+            [(url, t) for t in tags_list],
+        )
+        self._maybe_commit(len(tags_list))
+
+    def get_tags(self, url: str) -> list[str]:
+        url = preprocess_url(url)
+        return [
+            row[0]
+            for row in self.conn.execute(
+                "SELECT tag FROM tags WHERE url = ? ORDER BY tag", (url,)
+            )
+        ]
+
+    def get(self, url: str) -> dict | None:
+        """metadata for `url`, or `None` if it is not stored"""
+        url = preprocess_url(url)
+        row = self.conn.execute(
+            "SELECT data FROM meta WHERE url = ?", (url,)
+        ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def __getitem__(self, url: str) -> dict:
+        output: dict | None = self.get(url)
+        if output is None:
+            raise KeyError(f"no metadata for url {url}")
+        return output
+
+    def __contains__(self, url: str) -> bool:
+        url = preprocess_url(url)
+        return (
+            self.conn.execute("SELECT 1 FROM meta WHERE url = ?", (url,)).fetchone()
+            is not None
+        )
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM meta").fetchone()[0]
+
+    def scan(
+        self,
+        host: str | None = None,
+        tag: str | None = None,
+        error: bool | None = None,
+        limit: int | None = None,
+    ) -> Iterator[dict]:
+        """iterate over stored metadata matching all of the given filters
+
+        rows are streamed from the database rather than loaded at once
+        """
+        query: str = "SELECT meta.data FROM meta"
+        conditions: list[str] = list()
+        params: list[typing.Any] = list()
+        if tag is not None:
+            query += " JOIN tags ON tags.url = meta.url"
+            conditions.append("tags.tag = ?")
+            params.append(tag)
+        if host is not None:
+            conditions.append("meta.host = ?")
+            params.append(host.lower())
+        if error is not None:
+            conditions.append("meta.error = ?")
+            params.append(int(error))
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY meta.rowid"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        for row in self.conn.execute(query, params):
+            yield json.loads(row[0])
@@ -1,5 +1,4 @@
 import json
-import re
 import sys
 import typing
 
@@ -10,6 +9,9 @@ from bs4 import BeautifulSoup  # type: ignore[import]
 from tqdm import tqdm
 
 from bookmark_utils import Bookmark, BookmarkFolder
+from instrumentation import NULL_INSTRUMENTATION, Instrumentation, instrumented_run
+from metadata_store import MetadataStore
+from url_utils import preprocess_url
 
 # OPENAI_KEY: str = open('OPENAI_KEY.txt').read().strip()
 
@@ -36,27 +38,6 @@ def bs_find_text(soup: BeautifulSoup, *args, **kwargs) -> str:
         return temp.get_text().strip()
 
 
-def preprocess_url(url: str) -> str:
-    """preprocess URL according to certain rules
-
-    - `*arxiv.org/pdf/NNNN.pdf` -> `*arxiv.org/abs/NNNN`
-    - `twitter.com` -> `nitter.net`
-    """
-    # remove http prefix (provides no info, wastes tokens)
-    url = url.removeprefix("http://").removeprefix("https://")
-
-    # match group of digits and decimal point
-    m_arxiv = re.search(r"arxiv\.org/pdf/(\d+\.\d+)\.pdf", url)
-    # math any text after `twitter.com/`
-    m_twitter = re.search(r"twitter\.com/(.+)", url)
-    if m_arxiv:
-        return f"arxiv.org/abs/{m_arxiv.group(1)}"
-    elif m_twitter:
-        return f"nitter.net/{m_twitter.group(1)}"
-    else:
-        return url
-
-
 def get_arxiv_meta(
     soup: BeautifulSoup,
     # filter_keys: typing.Callable[[str], bool] = lambda k : True,
@@ -90,25 +71,41 @@ def get_arxiv_meta(
     return {k: v for k, v in output.items() if filter_keys(k)}
 
 
-def get_url_meta(url: str, do_except: bool = False) -> dict:
+def get_url_meta(
+    url: str,
+    do_except: bool = False,
+    instr: Instrumentation = NULL_INSTRUMENTATION,
+) -> dict:
     url = preprocess_url(url)
     url_fmt: str = f"http://{url}"
 
     try:
-        response: requests.Response = requests.get(url_fmt)
+        with instr.stage("http", url=url) as info:
+            response: requests.Response = requests.get(url_fmt)
+            info["bytes"] = len(response.content)
+            info["ok"] = response.ok
     except (
         requests.exceptions.ConnectionError,
         requests.exceptions.InvalidURL,
         ValueError,
     ) as e:
         print(f"with url:\n{url_fmt}\nerror: {e}", file=sys.stderr)
+        instr.count("errors")
         if do_except:
             raise e
 
         return dict(url=url, error=True)
 
-    soup: BeautifulSoup = BeautifulSoup(response.text, "html.parser")
+    with instr.stage("parse", url=url):
+        soup: BeautifulSoup = BeautifulSoup(response.text, "html.parser")
 
+    with instr.stage("extract", url=url):
+        output = _extract_meta(url, soup)
+
+    return output
+
+
+def _extract_meta(url: str, soup: BeautifulSoup) -> dict:
     title_obj = bs_find_text(soup, "title")
     title: str | None = None
     if title_obj is not None:
@@ -138,16 +135,53 @@ def get_url_meta(url: str, do_except: bool = False) -> dict:
 
 def process_urls(
     fname: str,
-    output_format: typing.Literal["json", "yaml", "yml"] = "yml",
+    output_format: typing.Literal["json", "yaml", "yml", "sqlite"] = "yml",
     input_format: typing.Literal["txt", "json", None] = None,
     do_except: bool = False,
+    output: str | None = None,
+    instrument: str | None = None,
+    instrument_format: typing.Literal["json", "chrome"] = "json",
+    profile: bool = False,
+    trace_memory: bool = False,
 ):
     """process a file of URLs and print to stdout a yaml file with the meta data
     Parameters:
       file (str): json or txt file
       output_format: format to use when writing the output
+      output: file to write to instead of stdout. required for `sqlite`
+        output, where records are appended to the database
+      instrument: if given, write per-stage timings to this file
+      instrument_format: `json` summary or `chrome` trace file
+      profile: also run under `cProfile` (requires `instrument`)
+      trace_memory: also run under `tracemalloc` (requires `instrument`)
     """
 
+    if output_format not in ["json", "yaml", "yml", "sqlite"]:
+        raise ValueError(f"Unknown output format: {output_format}")
+    if output_format == "sqlite" and output is None:
+        raise ValueError("`output` file must be given for sqlite output format")
+
+    with instrumented_run(
+        instrument, fmt=instrument_format, profile=profile, trace_memory=trace_memory
+    ) as instr:
+        _process_urls(
+            fname,
+            output_format=output_format,
+            input_format=input_format,
+            do_except=do_except,
+            output=output,
+            instr=instr,
+        )
+
+
+def _process_urls(
+    fname: str,
+    output_format: typing.Literal["json", "yaml", "yml", "sqlite"],
+    input_format: typing.Literal["txt", "json", None],
+    do_except: bool,
+    output: str | None,
+    instr: Instrumentation,
+):
     urls: list[str]
     if input_format is None:
         # guess input format
@@ -158,7 +192,7 @@ def process_urls(
         else:
             raise ValueError(f"can't infer format of file {fname}")
 
-    with open(fname) as f:
+    with instr.stage("load_input"), open(fname) as f:
         if input_format == "txt":
             urls = [line.strip() for line in f.readlines()]
         elif input_format == "json":
@@ -167,17 +201,37 @@ def process_urls(
         else:
             raise ValueError(f"Unknown input format: {input_format}")
 
+    if output_format == "sqlite":
+        # write records as they come in, rather than holding them all in memory
+        assert output is not None
+        with MetadataStore(output) as store:
+            for url in tqdm(urls, unit="url"):
+                url_meta: dict = get_url_meta(url, do_except=do_except, instr=instr)
+                with instr.stage("serialize", url=url_meta["url"]):
+                    store.append(url_meta)
+        return
+
     # get meta data and print as yaml
     meta: list[dict] = list()
     # each item is a url
     for url in tqdm(urls, unit="url"):
-        meta.append(get_url_meta(url, do_except=do_except))
+        meta.append(get_url_meta(url, do_except=do_except, instr=instr))
 
     # enforce this key order: url, title, headings
-    if output_format == "json":
-        print(json.dumps(meta, indent="  "))
-    elif output_format in ["yaml", "yml"]:
-        print(yaml.dump(meta, sort_keys=False))
+    with instr.stage("serialize", format=output_format):
+        meta_str: str
+        if output_format == "json":
+            meta_str = json.dumps(meta, indent="  ")
+        else:
+            # validated up front by `process_urls`
+            assert output_format in ["yaml", "yml"]
+            meta_str = yaml.dump(meta, sort_keys=False)
+
+        if output is None:
+            print(meta_str)
+        else:
+            with open(output, "w", encoding="utf-8") as f:
+                f.write(meta_str)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,28 @@
+"""URL normalisation shared by metadata extraction and storage
+
+kept free of network and parsing dependencies so that `metadata_store` can use it
+without importing `preprocess_urls`
+"""
+
+import re
+
+
+def preprocess_url(url: str) -> str:
+    """preprocess URL according to certain rules
+
+    - `*arxiv.org/pdf/NNNN.pdf` -> `*arxiv.org/abs/NNNN`
+    - `twitter.com` -> `nitter.net`
+    """
+    # remove http prefix (provides no info, wastes tokens)
+    url = url.removeprefix("http://").removeprefix("https://")
+
+    # match group of digits and decimal point
+    m_arxiv = re.search(r"arxiv\.org/pdf/(\d+\.\d+)\.pdf", url)
+    # math any text after `twitter.com/`
+    m_twitter = re.search(r"twitter\.com/(.+)", url)
+    if m_arxiv:
+        return f"arxiv.org/abs/{m_arxiv.group(1)}"
+    elif m_twitter:
+        return f"nitter.net/{m_twitter.group(1)}"
+    else:
+        return url